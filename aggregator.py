@@ -1,9 +1,11 @@
 # app/aggregator.py
 
-import openai
+from llm import create_chat_completion
+from tracing import traced
 from typing import List
 
 
+@traced()
 def aggregate_chunk_summaries_custom_structure(chunk_summaries: List[str]) -> str:
     """
     Takes multiple chunk summaries and merges them into a single structured therapy note.
@@ -72,7 +74,7 @@ CRITICAL REQUIREMENTS:
 Do NOT include any explanatory text or meta-commentary - return ONLY the formatted therapy note.
 """
 
-    response = openai.ChatCompletion.create(
+    response = create_chat_completion(
         model="gpt-3.5-turbo",  # Upgraded to GPT-4 for better quality
         messages=[
             {"role": "system", "content": system_prompt},
@@ -85,13 +87,15 @@ Do NOT include any explanatory text or meta-commentary - return ONLY the formatt
     final_note = response["choices"][0]["message"]["content"].strip()
     return final_note
 
-def final_aggregator_merge_two(note1: str, note2: str) -> str:
+@traced()
+def final_aggregator_merge_two(note1: str, note2: str, model: str = "gpt-4") -> str:
     """
     Merges two partial aggregator outputs into one final structured therapy note.
     We assume each partial note is already in your SOAP (or custom) format,
     and we want to produce a single, refined final version.
 
     We'll do a minimal LLM pass, removing duplicates or merging headings.
+    'model' can be set to a faster model when the note is short on time.
     """
 
     system_prompt = (
@@ -154,8 +158,8 @@ Additional improvements needed:
 Return ONLY the final text, do not add HTML or meta commentary.
 """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",  # or GPT-4 if you prefer
+    response = create_chat_completion(
+        model=model,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -0,0 +1,116 @@
+# bulk_export.py
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from note_structure import parse_note
+from note_renderers import render_json, render_markdown
+from final_html_constructor import render_html
+
+
+def _line_renderer(render):
+    # render_html yields lines without newlines (call_html_converter joins them)
+    def render_lines(note):
+        for line in render(note):
+            yield line + "\n"
+    return render_lines
+
+
+RENDERERS = {
+    "html": _line_renderer(render_html),
+    "json": render_json,
+    "md": render_markdown,
+}
+
+
+def export_note(
+    note_path: str,
+    output_dir: str,
+    formats: List[str],
+    transcript_dir: Optional[str] = None
+) -> int:
+    """
+    Parses one archived plain-text note once and streams it to every requested
+    format. If 'transcript_dir' holds a transcript with the same file name,
+    quotes get their transcript offsets. Returns the number of characters written.
+    """
+    with open(note_path, 'r', encoding='utf-8') as f:
+        final_text = f.read()
+
+    transcript = None
+    name = os.path.basename(note_path)
+    if transcript_dir:
+        transcript_path = os.path.join(transcript_dir, name)
+        if os.path.exists(transcript_path):
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                transcript = f.read()
+
+    note = parse_note(final_text, transcript)
+
+    stem = os.path.splitext(name)[0]
+    written = 0
+    for fmt in formats:
+        out_path = os.path.join(output_dir, f"{stem}.{fmt}")
+        with open(out_path, 'w', encoding='utf-8') as out:
+            for piece in RENDERERS[fmt](note):
+                out.write(piece)
+                written += len(piece)
+    return written
+
+
+def _export_task(args: Tuple[str, str, List[str], Optional[str]]) -> int:
+    return export_note(*args)
+
+
+def bulk_export(
+    input_pattern: str,
+    output_dir: str,
+    formats: List[str],
+    transcript_dir: Optional[str] = None,
+    workers: Optional[int] = None
+) -> dict:
+    """
+    Re-renders every archived note matching 'input_pattern' into 'output_dir',
+    in parallel across processes, and reports throughput.
+    """
+    unknown = [fmt for fmt in formats if fmt not in RENDERERS]
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {', '.join(unknown)}")
+
+    note_paths = sorted(glob.glob(input_pattern))
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, output_dir, formats, transcript_dir) for path in note_paths]
+
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Large chunks keep inter-process overhead small for tens of thousands of notes
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 8))
+        total_chars = sum(executor.map(_export_task, tasks, chunksize=chunksize))
+    elapsed = time.monotonic() - start
+
+    stats = {
+        "notes": len(note_paths),
+        "files": len(note_paths) * len(formats),
+        "characters": total_chars,
+        "seconds": round(elapsed, 2),
+        "notes_per_second": round(len(note_paths) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    print(f"[INFO] Exported {stats['notes']} notes ({stats['files']} files, {total_chars / 1e6:.1f}M chars) "
+          f"in {stats['seconds']}s - {stats['notes_per_second']} notes/s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-render archived plain-text notes to HTML, JSON and Markdown.")
+    parser.add_argument("input", help="glob pattern for archived notes, e.g. 'archive/*.txt'")
+    parser.add_argument("output_dir")
+    parser.add_argument("--formats", default="html,json,md", help="comma-separated: html, json, md")
+    parser.add_argument("--transcripts", default=None, help="directory with transcripts named like the notes")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: CPU count)")
+    args = parser.parse_args()
+
+    bulk_export(args.input, args.output_dir, args.formats.split(","), args.transcripts, args.workers)
@@ -0,0 +1,191 @@
+# deadline.py
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
+
+# Degradation ladder for the chunk loop, mildest first. Each step kicks in once
+# the remaining share of the note's time budget falls below its threshold.
+#
+# The aggregation steps come after these and are chosen by plan_aggregation()
+# from STAGE_ESTIMATES. They run in the reverse of the originally requested
+# order: first 'fast_merge_model', then 'collapse_aggregation'. Collapsing
+# drops the final merge altogether, so a faster merge model after it would
+# never apply. Collapsing is also the cheapest option and loses the most
+# quality, which makes it the last resort.
+DEGRADATION_LADDER = [
+    ("skip_label_refinement", 0.60),   # skip refine_llm_labels
+    ("skip_fix_loop", 0.45),           # skip fix / re-evaluate in the quality loop
+]
+
+# Rough wall-clock cost (seconds) of the stages after the chunk loop. Used to
+# decide up front whether they still fit in what is left of the budget.
+STAGE_ESTIMATES = {
+    "fix_loop": 45.0,       # fix generation + batched re-evaluation
+    "aggregate": 25.0,      # one aggregate_chunk_summaries_custom_structure call
+    "merge": 60.0,          # final_aggregator_merge_two on gpt-4
+    "fast_merge": 20.0,     # final_aggregator_merge_two on FAST_MERGE_MODEL
+}
+
+FAST_MERGE_MODEL = "gpt-3.5-turbo"
+
+_active_deadline = contextvars.ContextVar("active_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when an LLM call of an optional stage would start, or has failed,
+    after the time that stage may use ran out.
+    """
+
+
+class Deadline:
+    """
+    Time budget for generating one note.
+    Stages ask `should_degrade(step)` before doing optional work and
+    `plan_aggregation()` before aggregating; every step that was actually
+    applied is recorded so it can go into the output metadata.
+
+    Optional stages (evaluation, fixes) run under `deadline.reserving(seconds)`:
+    while the deadline is active (`with deadline.activate():`) their LLM
+    calls' timeouts are capped by the time left minus 'seconds', and calls are
+    refused once that is spent, so they can't eat into the time the required
+    stages after them need. Required stages always run to completion; if they
+    overrun the budget, that is recorded as 'budget_exceeded' in the metadata.
+
+    A Deadline without a budget never degrades or caps anything.
+    """
+
+    def __init__(self, budget_seconds: Optional[float] = None, stage_estimates: Optional[Dict[str, float]] = None):
+        self.budget_seconds = budget_seconds
+        self.stage_estimates = dict(STAGE_ESTIMATES, **(stage_estimates or {}))
+        self.start = time.monotonic()
+        self.applied: List[str] = []
+        # Seconds held back for later stages; None outside optional stages
+        self.reserved: Optional[float] = None
+        self._thresholds: Dict[str, float] = dict(DEGRADATION_LADDER)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left in the budget (negative once overrun), or None if there is no budget.
+        """
+        if self.budget_seconds is None:
+            return None
+        return self.budget_seconds - self.elapsed()
+
+    def available(self) -> Optional[float]:
+        """
+        Seconds the current stage may use: what is left minus any reserved time.
+        """
+        if self.budget_seconds is None:
+            return None
+        return self.remaining() - (self.reserved or 0.0)
+
+    def can_afford(self, *stages: str) -> bool:
+        """
+        True if the estimated cost of 'stages' fits in the available time.
+        """
+        if self.budget_seconds is None:
+            return True
+        return self.available() >= sum(self.stage_estimates[stage] for stage in stages)
+
+    def record(self, step: str):
+        if step not in self.applied:
+            self.applied.append(step)
+            print(f"[INFO] Deadline: applying '{step}' ({max(self.remaining(), 0):.1f}s left)")
+
+    def should_degrade(self, step: str) -> bool:
+        """
+        Returns True if 'step' of the ladder should be applied now, and records it.
+        """
+        if step not in self._thresholds:
+            raise ValueError(f"Unknown degradation step: {step}")
+        if self.budget_seconds is None:
+            return False
+
+        remaining_fraction = self.remaining() / self.budget_seconds
+        if remaining_fraction >= self._thresholds[step]:
+            return False
+
+        self.record(step)
+        return True
+
+    def plan_aggregation(self) -> Tuple[bool, str]:
+        """
+        Decides before aggregating, from the stage estimates, how much of the
+        aggregation still fits: halves + gpt-4 merge, halves + fast merge, or a
+        single collapsed aggregator pass (see the note above DEGRADATION_LADDER
+        on why the fast merge comes first). Returns (collapse, merge_model).
+        """
+        if self.can_afford("aggregate", "aggregate", "merge"):
+            return False, "gpt-4"
+        if self.can_afford("aggregate", "aggregate", "fast_merge"):
+            self.record("fast_merge_model")
+            return False, FAST_MERGE_MODEL
+        self.record("collapse_aggregation")
+        return True, FAST_MERGE_MODEL
+
+    def caps_calls(self) -> bool:
+        """
+        True while LLM calls are limited by the budget, i.e. inside an optional stage.
+        """
+        return self.budget_seconds is not None and self.reserved is not None
+
+    def call_timeout(self, timeout: Union[float, Tuple[float, float]]) -> Union[float, Tuple[float, float]]:
+        """
+        Caps an optional stage's LLM call timeout by the available time.
+        Raises DeadlineExceeded if there is none left. Calls of required
+        stages keep their timeout.
+        """
+        if not self.caps_calls():
+            return timeout
+        available = self.available()
+        if available <= 0:
+            raise DeadlineExceeded(f"Note budget of {self.budget_seconds}s is spent")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, available) for t in timeout)
+        return min(timeout, available)
+
+    @contextmanager
+    def activate(self):
+        """
+        Makes this the deadline that LLM calls in the current context respect.
+        """
+        token = _active_deadline.set(self)
+        try:
+            yield self
+        finally:
+            _active_deadline.reset(token)
+
+    @contextmanager
+    def reserving(self, seconds: float):
+        """
+        Runs an optional stage: its LLM calls are capped by the budget, with
+        'seconds' held back for the required stages after it.
+        """
+        previous = self.reserved
+        self.reserved = seconds
+        try:
+            yield
+        finally:
+            self.reserved = previous
+
+    def metadata(self) -> dict:
+        """
+        Summary of the budget and the degradations applied, for the output metadata.
+        """
+        remaining = self.remaining()
+        return {
+            "budget_seconds": self.budget_seconds,
+            "elapsed_seconds": round(self.elapsed(), 2),
+            "degradations": list(self.applied),
+            "budget_exceeded": remaining is not None and remaining < 0,
+        }
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _active_deadline.get()
@@ -1,61 +1,50 @@
 # final_html_constructor.py
 
 import re
+from typing import Iterator
 
+from note_structure import Note, parse_note
+from tracing import traced
 
+
+@traced()
 def call_html_converter(final_text):
     """
     Converts therapy notes to HTML with smart line breaks.
     """
-    # Extract all sections from the text
-    sections = {}
-    current_section = None
-    section_content = []
-
-    # Process each line
-    for line in final_text.splitlines():
-        line_stripped = line.strip()
-
-        if line_stripped in ["Speech Therapy Note", "Subjective", "Objective", "Assessment", "Plan"]:
-            # Save previous section if it exists
-            if current_section:
-                sections[current_section] = "\n".join(section_content)
-                section_content = []
-
-            current_section = line_stripped
-        elif current_section:
-            section_content.append(line)
+    return "\n".join(render_html(parse_note(final_text)))
 
-    # Add the last section
-    if current_section and section_content:
-        sections[current_section] = "\n".join(section_content)
 
-    # Build the HTML
-    result = ["<html><body><pre>"]
+def render_html(note: Note) -> Iterator[str]:
+    """
+    Renders a parsed note as HTML, yielding one line (or block) at a time.
+    Every sentence goes on its own line, with smart line breaks inside it.
+    """
+    yield "<html><body><pre>"
 
     # Add title
-    result.append("<b>Speech Therapy Note</b>")
+    yield f"<b>{note.title}</b>"
 
     # Add each section
-    for section in ["Subjective", "Objective", "Assessment", "Plan"]:
-        if section in sections:
-            # Add section header
-            result.append("")
-            result.append(f"<b>{section}</b>")
-            content = sections[section].strip()
-
-            if section == "Plan":
-                # Plan section is treated differently (keep numbering)
-                result.append(content)
-            else:
-                # Other sections get smart line breaking
-                formatted = add_smart_line_breaks(content)
-                result.append(formatted)
+    for section in note.sections:
+        # Add section header
+        yield ""
+        yield f"<b>{section.name}</b>"
+
+        if section.name == "Plan":
+            # Plan section is treated differently (keep numbering)
+            lines = [sentence.text for sentence in section.plan_intro]
+            lines += [f"{item.number}. {item.text}" for item in section.plan_items]
+            lines += [sentence.text for sentence in section.plan_outro]
+            if not section.plan_items:
+                lines = [sentence.text for sentence in section.sentences]
+            yield "\n".join(lines)
+        else:
+            # Other sections get smart line breaking
+            yield "\n".join(add_smart_line_breaks(sentence.text) for sentence in section.sentences)
 
     # Finish the HTML
-    result.append("</pre></body></html>")
-
-    return "\n".join(result)
+    yield "</pre></body></html>"
 
 
 def add_smart_line_breaks(text):
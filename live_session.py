@@ -0,0 +1,221 @@
+# live_session.py
+
+import argparse
+import codecs
+import os
+import socket
+import time
+from typing import Iterator, List, Optional
+
+from utils import openai_setup, normalize_whitespace
+from chunker import chunk_transcript_into_docs
+from aggregator import (
+    aggregate_chunk_summaries_custom_structure,
+    final_aggregator_merge_two
+)
+from final_html_constructor import call_html_converter
+from main import process_chunk
+
+
+class LiveSession:
+    """
+    Builds a therapy note while the session is still running.
+    Transcript text is fed in as it arrives; every chunk is attributed,
+    summarized and evaluated as soon as it is complete, and folded into a
+    running partial note. When the session ends only the
+    trailing chunk and the final merge are left to do.
+    """
+
+    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 120):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.buffer = ""
+        self.chunk_summaries: List[str] = []
+        self.scores: List[int] = []
+        self.partial_note: Optional[str] = None
+        # How many chunk summaries the running partial note covers
+        self.partial_note_count = 0
+
+    def feed(self, text: str) -> None:
+        """
+        Appends newly transcribed text and processes any chunks that are now complete.
+        """
+        # Writes can end mid-word, so keep the raw text and only normalize the
+        # whole buffer (normalizing each piece would split or glue words)
+        self.buffer += text
+        normalized = normalize_whitespace(self.buffer)
+        if not normalized:
+            return
+
+        docs = chunk_transcript_into_docs(
+            normalized, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+        )
+        if len(docs) < 2:
+            return
+
+        # The last document may still grow with the next append, so only the
+        # ones before it are complete. It already carries the overlap.
+        for doc in docs[:-1]:
+            self._process(doc.page_content)
+        # Keep a trailing space so the next write doesn't get glued onto the last word
+        ends_with_space = self.buffer[-1].isspace()
+        self.buffer = docs[-1].page_content + (" " if ends_with_space else "")
+
+        self._update_partial_note()
+
+    def _update_partial_note(self) -> None:
+        """
+        Folds the summaries that arrived since the last update into the running
+        partial note. Only the note and the new summaries are sent, so each
+        update costs about the same however long the session already is.
+        """
+        new_summaries = self.chunk_summaries[self.partial_note_count:]
+        if not new_summaries:
+            return
+        previous = [self.partial_note] if self.partial_note is not None else []
+        self.partial_note = aggregate_chunk_summaries_custom_structure(previous + new_summaries)
+        self.partial_note_count = len(self.chunk_summaries)
+        print(f"[INFO] Partial note updated ({self.partial_note_count} chunks)")
+
+    def finish(self) -> str:
+        """
+        Processes whatever is left in the buffer and merges it into the running
+        partial note. Returns the final plain-text note.
+        """
+        normalized = normalize_whitespace(self.buffer)
+        if normalized:
+            docs = chunk_transcript_into_docs(
+                normalized, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+            )
+            for doc in docs:
+                self._process(doc.page_content)
+            self.buffer = ""
+
+        if not self.chunk_summaries:
+            raise ValueError("No transcript text was received during the session.")
+
+        if self.partial_note is None:
+            if len(self.chunk_summaries) == 1:
+                # Nothing to merge: an aggregator pass over an empty half would invent content
+                return aggregate_chunk_summaries_custom_structure(self.chunk_summaries)
+            # Session was too short for a running note: same halves approach as main
+            mid = len(self.chunk_summaries) // 2
+            note_1 = aggregate_chunk_summaries_custom_structure(self.chunk_summaries[:mid])
+            note_2 = aggregate_chunk_summaries_custom_structure(self.chunk_summaries[mid:])
+        else:
+            new_summaries = self.chunk_summaries[self.partial_note_count:]
+            if not new_summaries:
+                # The running note already covers everything
+                return self.partial_note
+            note_1 = self.partial_note
+            note_2 = aggregate_chunk_summaries_custom_structure(new_summaries)
+
+        return final_aggregator_merge_two(note_1, note_2)
+
+    def _process(self, text_chunk: str) -> None:
+        summary, score = process_chunk(text_chunk)
+        self.chunk_summaries.append(summary)
+        self.scores.append(score)
+
+
+def tail_file(
+    file_path: str,
+    poll_interval: float = 0.5,
+    idle_timeout: float = 60.0,
+    end_marker: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Yields text as it is appended to 'file_path' (like `tail -f`).
+    Stops once 'end_marker' shows up in the text or nothing new has been
+    written for 'idle_timeout' seconds.
+    """
+    while not os.path.exists(file_path):
+        time.sleep(poll_interval)
+
+    # A write can split the end marker across two reads, so the last
+    # len(end_marker) - 1 characters are held back until the next read
+    held_back = len(end_marker) - 1 if end_marker else 0
+    pending = ""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        last_data = time.monotonic()
+        while True:
+            data = f.read()
+            if data:
+                last_data = time.monotonic()
+                data = pending + data
+                if end_marker and end_marker in data:
+                    head = data.split(end_marker, 1)[0]
+                    if head:
+                        yield head
+                    return
+                split = max(len(data) - held_back, 0)
+                data, pending = data[:split], data[split:]
+                if data:
+                    yield data
+            elif time.monotonic() - last_data > idle_timeout:
+                if pending:
+                    yield pending
+                return
+            else:
+                time.sleep(poll_interval)
+
+
+def read_socket(host: str = "127.0.0.1", port: int = 8765, bufsize: int = 4096) -> Iterator[str]:
+    """
+    Listens on a local TCP socket and yields the UTF-8 text sent by a single
+    client (e.g. the ASR process). The session ends when the client disconnects.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with socket.create_server((host, port)) as server:
+        print(f"[INFO] Waiting for transcript stream on {host}:{port}")
+        conn, _ = server.accept()
+        with conn:
+            while True:
+                data = conn.recv(bufsize)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def run_live_session(source: Iterator[str], output_path: str = "final_therapy_note.html") -> str:
+    """
+    Feeds every piece of text from 'source' into a LiveSession and writes the
+    final HTML note once the source is exhausted.
+    """
+    openai_setup()
+    session = LiveSession()
+    for text in source:
+        session.feed(text)
+
+    session_end = time.monotonic()
+    final_text_note = session.finish()
+    final_html = call_html_converter(final_text_note)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(final_html)
+
+    print(f"[INFO] Done! Final therapy note saved to {output_path} "
+          f"({time.monotonic() - session_end:.1f}s after session end)")
+    return final_text_note
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a therapy note while the session is running.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--file", help="transcript file to tail")
+    group.add_argument("--port", type=int, help="local port to receive the transcript stream on")
+    parser.add_argument("--end-marker", default=None, help="text that marks the end of the session in a tailed file")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="seconds without new text before a tailed session ends")
+    parser.add_argument("--output", default="final_therapy_note.html")
+    args = parser.parse_args()
+
+    if args.file:
+        source = tail_file(args.file, idle_timeout=args.idle_timeout, end_marker=args.end_marker)
+    else:
+        source = read_socket(port=args.port)
+    run_live_session(source, args.output)
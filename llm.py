@@ -0,0 +1,390 @@
+# llm.py
+
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Optional, Tuple, Union
+
+import aiohttp
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import DeadlineExceeded, current_deadline
+from tracing import span
+
+
+class HedgingPolicy:
+    """
+    Hedged requests for chat completions.
+    If a call has not returned after the configured latency percentile for its
+    model, a duplicate request is sent and whichever finishes first wins.
+    Only calls with temperature=0 are hedged, since only then is the
+    duplicate interchangeable; sampled calls (e.g. the speculative fix
+    candidates) are sent once.
+
+    On the sync path the losing request cannot be interrupted mid-flight (the
+    openai client is blocking), so it is cancelled if it has not started yet
+    and otherwise its result is simply discarded. On the async path the loser
+    is cancelled outright.
+    """
+
+    def __init__(
+        self,
+        percentiles: Optional[Dict[str, float]] = None,
+        initial_delays: Optional[Dict[str, float]] = None,
+        default_percentile: float = 0.95,
+        min_samples: int = 10,
+        window: int = 200,
+        max_workers: int = 32
+    ):
+        # Per-model latency percentile after which we hedge, e.g. {"gpt-4": 0.9}
+        self.percentiles = percentiles or {}
+        self.default_percentile = default_percentile
+        # Hedge delays (seconds) used until a model has 'min_samples' latencies
+        self.initial_delays = initial_delays if initial_delays is not None else {
+            "gpt-4": 40.0,
+            "gpt-3.5-turbo": 15.0,
+        }
+        self.min_samples = min_samples
+
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._metrics = defaultdict(lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0})
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        Seconds to wait before sending a duplicate, or None to never hedge this call.
+        """
+        with self._lock:
+            samples = sorted(self._latencies[model])
+        if len(samples) < self.min_samples:
+            return self.initial_delays.get(model)
+        percentile = self.percentiles.get(model, self.default_percentile)
+        index = min(int(percentile * len(samples)), len(samples) - 1)
+        return samples[index]
+
+    def _count(self, model: str, key: str):
+        with self._lock:
+            self._metrics[model][key] += 1
+
+    def _record_latency(self, model: str, latency: float):
+        # Always the latency the caller saw, measured from the primary's start.
+        # Recording a winning hedge's own (short) duration would pull the
+        # percentile down and make hedging ever more aggressive.
+        with self._lock:
+            self._latencies[model].append(latency)
+
+    def call(self, fn, kwargs: dict):
+        """
+        Runs fn(**kwargs), hedging it once if it is slower than the percentile
+        for kwargs["model"].
+        """
+        model = kwargs["model"]
+        delay = self.hedge_delay(model)
+        self._count(model, "calls")
+
+        started = set()
+        call_start = time.monotonic()
+        primary = self._executor.submit(fn, **kwargs)
+        started.add(primary)
+
+        if delay is not None:
+            done, _ = wait([primary], timeout=delay)
+            if not done:
+                hedge = self._executor.submit(fn, **kwargs)
+                started.add(hedge)
+                self._count(model, "hedged")
+
+        error = None
+        while started:
+            done, _ = wait(list(started), return_when=FIRST_COMPLETED)
+            for future in done:
+                started.discard(future)
+                if future.exception() is not None:
+                    # The other request may still succeed
+                    error = future.exception()
+                    continue
+                for other in started:
+                    other.cancel()
+                self._record_latency(model, time.monotonic() - call_start)
+                if future is not primary:
+                    self._count(model, "hedge_wins")
+                return future.result()
+        raise error
+
+    async def acall(self, coro_fn, kwargs: dict):
+        """
+        Async version of call(): awaits coro_fn(**kwargs), hedging it once if
+        it is slower than the percentile for kwargs["model"].
+        """
+        model = kwargs["model"]
+        delay = self.hedge_delay(model)
+        self._count(model, "calls")
+
+        started = set()
+        call_start = time.monotonic()
+        primary = asyncio.ensure_future(coro_fn(**kwargs))
+        started.add(primary)
+
+        if delay is not None:
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if not done:
+                hedge = asyncio.ensure_future(coro_fn(**kwargs))
+                started.add(hedge)
+                self._count(model, "hedged")
+
+        error = None
+        try:
+            while started:
+                done, _ = await asyncio.wait(list(started), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    started.discard(task)
+                    if task.exception() is not None:
+                        # The other request may still succeed
+                        error = task.exception()
+                        continue
+                    self._record_latency(model, time.monotonic() - call_start)
+                    if task is not primary:
+                        self._count(model, "hedge_wins")
+                    return task.result()
+            raise error
+        finally:
+            for task in started:
+                task.cancel()
+
+    def metrics(self) -> dict:
+        """
+        Per-model call counts, hedge rate and how often the hedge won.
+        """
+        with self._lock:
+            result = {}
+            for model, counts in self._metrics.items():
+                entry = dict(counts)
+                entry["hedge_rate"] = round(counts["hedged"] / counts["calls"], 3) if counts["calls"] else 0.0
+                entry["hedge_win_rate"] = round(counts["hedge_wins"] / counts["hedged"], 3) if counts["hedged"] else 0.0
+                result[model] = entry
+            return result
+
+
+_hedging_policy: Optional[HedgingPolicy] = None
+
+
+def enable_hedging(policy: Optional[HedgingPolicy] = None) -> HedgingPolicy:
+    """
+    Turns on hedged requests for every chat completion call.
+    """
+    global _hedging_policy
+    _hedging_policy = policy or HedgingPolicy()
+    return _hedging_policy
+
+
+def disable_hedging():
+    global _hedging_policy
+    _hedging_policy = None
+
+
+def get_hedging_metrics() -> dict:
+    return _hedging_policy.metrics() if _hedging_policy else {}
+
+
+class _SharedSession(requests.Session):
+    """
+    requests.Session shared by every thread.
+
+    openai 0.x caches its session per thread and closes it once it is older
+    than MAX_SESSION_LIFETIME_SECS. With one shared session that close would
+    tear down the pool all other threads are using, so close() is a no-op
+    here; the pool is shut down with shutdown() (LLMClient.close()).
+    """
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class LLMClient:
+    """
+    Shared client for all chat completion calls.
+
+    - Sync calls go through one pooled keep-alive requests.Session, so TLS
+      connections are reused instead of being set up per call.
+    - Async calls go through a pooled aiohttp session (one per event loop).
+    - Every call gets a (connect, read) timeout unless it passes its own
+      'request_timeout'.
+    - 'api_base' makes the endpoint pluggable, e.g. a local stand-in server
+      for testing ("http://127.0.0.1:8000/v1").
+    """
+
+    def __init__(
+        self,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        timeout: Union[float, Tuple[float, float]] = (10.0, 120.0),
+        pool_size: int = 32,
+        keepalive_seconds: float = 60.0
+    ):
+        self.api_base = api_base
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keepalive_seconds = keepalive_seconds
+
+        self.session = _SharedSession()
+        # Keeps the connection retries openai 0.x's own session has (MAX_CONNECTION_RETRIES)
+        adapter = HTTPAdapter(max_retries=2, pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._aio_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+    def _request_kwargs(self, kwargs: dict) -> dict:
+        kwargs = dict(kwargs)
+        kwargs.setdefault("request_timeout", self.timeout)
+        if self.api_base:
+            kwargs.setdefault("api_base", self.api_base)
+        if self.api_key:
+            kwargs.setdefault("api_key", self.api_key)
+        return kwargs
+
+    def chat_completion(self, **kwargs):
+        """
+        Blocking chat completion over the pooled session.
+        """
+        return openai.ChatCompletion.create(**self._request_kwargs(kwargs))
+
+    async def achat_completion(self, **kwargs):
+        """
+        Async chat completion over the pooled aiohttp session of the running loop.
+        """
+        token = openai.aiosession.set(self._aio_session())
+        try:
+            return await openai.ChatCompletion.acreate(**self._request_kwargs(kwargs))
+        finally:
+            openai.aiosession.reset(token)
+
+    def _aio_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._aio_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_seconds)
+            session = aiohttp.ClientSession(connector=connector)
+            self._aio_sessions[loop] = session
+        return session
+
+    def close(self):
+        self.session.shutdown()
+
+    async def aclose(self):
+        """
+        Closes the aiohttp session of the running loop. Call before the loop ends.
+        """
+        session = self._aio_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def _install(client: LLMClient) -> LLMClient:
+    """
+    Makes 'client' the shared client and hands its session to openai 0.x,
+    which takes its HTTP session from this module-level hook.
+    """
+    global _llm_client
+    _llm_client = client
+    openai.requestssession = client.session
+    return client
+
+
+def set_llm_client(client: LLMClient) -> LLMClient:
+    """
+    Replaces the shared client. Call it at startup, before any LLM call:
+    openai 0.x caches a session per thread, so threads that already made a
+    call keep using the previous client's session until openai renews it
+    (after MAX_SESSION_LIFETIME_SECS).
+    """
+    return _install(client)
+
+
+def get_llm_client() -> LLMClient:
+    """
+    The shared client; created on first use from LLM_API_BASE and LLM_TIMEOUT if set.
+    """
+    if _llm_client is None:
+        timeout = os.environ.get("LLM_TIMEOUT")
+        _install(LLMClient(
+            api_base=os.environ.get("LLM_API_BASE"),
+            timeout=(10.0, float(timeout)) if timeout else (10.0, 120.0)
+        ))
+    return _llm_client
+
+
+def _apply_deadline(client: LLMClient, kwargs: dict):
+    """
+    Caps the call's timeout by the active note deadline when the call belongs
+    to an optional stage. Returns (kwargs, deadline).
+    """
+    deadline = current_deadline()
+    if deadline is None or not deadline.caps_calls():
+        return kwargs, None
+    kwargs = dict(kwargs)
+    kwargs["request_timeout"] = deadline.call_timeout(kwargs.get("request_timeout", client.timeout))
+    return kwargs, deadline
+
+
+def _hedged(kwargs: dict) -> bool:
+    """
+    True if the call should go through the hedging policy: hedging is on and
+    the call is deterministic (openai's default temperature is 1).
+    """
+    return _hedging_policy is not None and kwargs.get("temperature", 1) == 0
+
+
+def _out_of_budget(deadline, error: Exception) -> bool:
+    if deadline is None or not deadline.caps_calls() or isinstance(error, DeadlineExceeded):
+        return False
+    available = deadline.available()
+    return available is not None and available <= 0
+
+
+def create_chat_completion(**kwargs):
+    """
+    Single entry point for chat completion calls; takes the same arguments
+    as openai.ChatCompletion.create and returns its response.
+    """
+    client = get_llm_client()
+    kwargs, deadline = _apply_deadline(client, kwargs)
+    with span("chat_completion", "llm", model=kwargs.get("model")):
+        try:
+            if not _hedged(kwargs):
+                return client.chat_completion(**kwargs)
+            return _hedging_policy.call(client.chat_completion, kwargs)
+        except Exception as e:
+            if _out_of_budget(deadline, e):
+                raise DeadlineExceeded(f"LLM call ran out of the note budget: {e}") from e
+            raise
+
+
+async def acreate_chat_completion(**kwargs):
+    """
+    Async counterpart of create_chat_completion, for fanning out many calls at once.
+    """
+    client = get_llm_client()
+    kwargs, deadline = _apply_deadline(client, kwargs)
+    with span("chat_completion", "llm", model=kwargs.get("model")):
+        try:
+            if not _hedged(kwargs):
+                return await client.achat_completion(**kwargs)
+            return await _hedging_policy.acall(client.achat_completion, kwargs)
+        except Exception as e:
+            if _out_of_budget(deadline, e):
+                raise DeadlineExceeded(f"LLM call ran out of the note budget: {e}") from e
+            raise
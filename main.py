@@ -1,84 +1,283 @@
 # main.py
 
 import os
+import json
+import asyncio
+from collections import defaultdict
 from utils import load_transcript, openai_setup
 from chunker import chunk_transcript_into_docs
 from speaker_attribution import multi_step_speaker_attribution
-from summarizer import summarize_speaker_pairs, fix_summary_with_critique
-from quality_assessment import llm_evaluate_summary
+from summarizer import summarize_speaker_pairs, fix_summary_with_critique, afix_summary_with_critique
+from quality_assessment import llm_evaluate_summary, llm_evaluate_summaries_batch, allm_evaluate_summaries_batch
 from aggregator import (
     aggregate_chunk_summaries_custom_structure,
     final_aggregator_merge_two
 )
 from final_html_constructor import call_html_converter  # new "API"
+from deadline import Deadline, DeadlineExceeded
+from llm import enable_hedging, get_hedging_metrics, get_llm_client
+from prompt_compression import compress_conversation_for_fix, compress_chunk_for_evaluation
+from tracing import enable_tracing, save_trace, span, traced
 
-def main():
+# Speculative fix candidates: (temperature, extra priority for the fix prompt).
+# The first one is the regular fix.
+FIX_CANDIDATE_SETTINGS = [
+    (0.0, ""),
+    (0.4, "Add every clinical detail the critique says is missing."),
+    (0.4, "Make sure each client feeling or thought is directly followed by its quote."),
+    (0.7, "Tighten the narrative and remove redundancy while keeping every key insight."),
+]
+
+
+def attribute_and_summarize(text_chunk, deadline):
+    """
+    Speaker attribution and summarization for one chunk.
+    Returns (speaker_pairs, summary).
+    """
+    # Speaker attribution
+    refine = not deadline.should_degrade("skip_label_refinement")
+    speaker_pairs = multi_step_speaker_attribution(text_chunk, refine=refine)
+
+    # Summarize
+    summary = summarize_speaker_pairs(speaker_pairs)
+    print (summary)
+    return speaker_pairs, summary
+
+
+def evaluation_input(text_chunk, summary):
+    """
+    The (chunk, summary) pair sent to the evaluator, with filler and boilerplate trimmed from the chunk.
+    """
+    eval_chunk, _ = compress_chunk_for_evaluation(text_chunk, summary)
+    return eval_chunk, summary
+
+
+def fix_input(summary, critique, speaker_pairs):
+    """
+    The conversation sent with a fix request: only the parts the critique and quotes point at.
+    """
+    conversation_text = "\n".join(f"{spk}: {txt}" for (spk, txt) in speaker_pairs)
+    fix_conversation, _ = compress_conversation_for_fix(conversation_text, summary, critique)
+    return fix_conversation
+
+
+def generate_fix(summary, critique, speaker_pairs):
+    """
+    Asks for a fixed summary.
+    """
+    return fix_summary_with_critique(summary, critique, fix_input(summary, critique, speaker_pairs))
+
+
+async def generate_fix_candidates(jobs, n_candidates):
+    """
+    Speculative fixes: generates 'n_candidates' fixes (varied temperature and
+    prompt priority) for every (chunk_index, summary, critique, speaker_pairs)
+    job, all concurrently. Returns {chunk_index: [candidate, ...]};
+    candidates whose request failed are left out.
+    """
+    async def candidate(i, summary, critique, fix_conversation, temperature, focus):
+        with span("fix_candidate", chunk=i, temperature=temperature):
+            return i, await afix_summary_with_critique(summary, critique, fix_conversation, temperature, focus)
+
+    tasks = []
+    for i, summary, critique, speaker_pairs in jobs:
+        fix_conversation = fix_input(summary, critique, speaker_pairs)
+        for temperature, focus in FIX_CANDIDATE_SETTINGS[:n_candidates]:
+            tasks.append(candidate(i, summary, critique, fix_conversation, temperature, focus))
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    candidates = defaultdict(list)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"[WARN] Fix candidate failed: {result}")
+            continue
+        i, fixed = result
+        candidates[i].append(fixed)
+    return candidates
+
+
+async def speculative_fixes(jobs, n_candidates, text_chunks):
+    """
+    Generates the fix candidates for every job and re-scores all of them, with
+    the evaluator batches sent concurrently.
+    Returns (fixes, new_evaluations) where fixes is a list of (chunk_index, candidate).
+    """
+    try:
+        with span("fix_candidates"):
+            candidates = await generate_fix_candidates(jobs, n_candidates)
+        fixes = [(i, fixed) for i, *_ in jobs for fixed in candidates.get(i, [])]
+        with span("re_evaluate"):
+            new_evaluations = await allm_evaluate_summaries_batch(
+                [evaluation_input(text_chunks[i], fixed) for i, fixed in fixes]
+            )
+    finally:
+        await get_llm_client().aclose()
+    return fixes, new_evaluations
+
+
+def process_chunk(text_chunk, deadline=None):
+    """
+    Runs a single transcript chunk through speaker attribution, summarization
+    and evaluation. If the score is below 85 we try one fix pass and keep it
+    only when it scores better. Returns (summary, score).
+
+    'deadline' is an optional Deadline; when time runs short the label
+    refinement pass and the fix loop are skipped.
+    """
+    deadline = deadline or Deadline()
+    speaker_pairs, summary = attribute_and_summarize(text_chunk, deadline)
+
+    # Evaluate
+    score, critique = llm_evaluate_summary(*evaluation_input(text_chunk, summary))
+    print (score)
+    if score < 85 and not deadline.should_degrade("skip_fix_loop"):
+        # Attempt re-fix
+        fixed = generate_fix(summary, critique, speaker_pairs)
+        new_score, new_crit = llm_evaluate_summary(*evaluation_input(text_chunk, fixed))
+        if new_score > score:
+            summary = fixed
+            print(f"SUCCESS IMPROVEMENT {new_score}")
+            score=new_score
+    return summary, score
+
+
+@traced()
+def main(deadline_seconds=None, fix_candidates=1):
     # Setup
     openai_setup()
-    scores_list=[]
-    total_score=0
-    # Load transcript
-    file_path = "Example_Transcript_for_Testing.txt"
-    raw_text = load_transcript(file_path)
-
-    # Chunk transcript
-    docs = chunk_transcript_into_docs(raw_text, chunk_size=1500, chunk_overlap=120)
-
-    chunk_summaries = []
-    for i, doc in enumerate(docs):
-        text_chunk = doc.page_content
-
-        # Speaker attribution
-        speaker_pairs = multi_step_speaker_attribution(text_chunk)
-
-        # Summarize
-        summary = summarize_speaker_pairs(speaker_pairs)
-        print (summary)
-
-        # Evaluate
-        score, critique = llm_evaluate_summary(text_chunk, summary)
-        print (score)
-        if score < 85:
-            # Attempt re-fix
-            conversation_text = "\n".join(f"{spk}: {txt}" for (spk, txt) in speaker_pairs)
-            fixed = fix_summary_with_critique(summary, critique, conversation_text)
-            new_score, new_crit = llm_evaluate_summary(text_chunk, fixed)
-            if new_score > score:
-                summary = fixed
-                print(f"SUCCESS IMPROVEMENT {new_score}")
-                score=new_score
-        total_score=total_score+score
-        scores_list.append(score)
-        chunk_summaries.append(summary)
-
-    # Now we do the multi aggregator approach:
-    # 1) aggregator pass on the first half
-    # 2) aggregator pass on the second half
-    # 3) final aggregator merges them
-
-    n = len(chunk_summaries)
-    mid = n // 2
-    first_half = chunk_summaries[:mid]
-    second_half = chunk_summaries[mid:]
-    average_score=total_score/n
-    # aggregator #1
-    partial_note_1 = aggregate_chunk_summaries_custom_structure(first_half)
-
-    # aggregator #2
-    partial_note_2 = aggregate_chunk_summaries_custom_structure(second_half)
-
-    # final aggregator merges partial notes
-    final_text_note = final_aggregator_merge_two(partial_note_1, partial_note_2)
-
-    # Instead of local convert, we call the "API"
-    final_html = call_html_converter(final_text_note)
-
-    # Save result
-    with open("final_therapy_note.html", "w", encoding="utf-8") as f:
-        f.write(final_html)
+    deadline = Deadline(deadline_seconds)
+    if fix_candidates > len(FIX_CANDIDATE_SETTINGS):
+        print(f"[WARN] {fix_candidates} fix candidates requested, using {len(FIX_CANDIDATE_SETTINGS)}")
+    fix_candidates = max(1, min(fix_candidates, len(FIX_CANDIDATE_SETTINGS)))
+    # LLM calls of the optional stages below are capped by the note's remaining budget
+    with deadline.activate():
+        # Load transcript
+        file_path = "Example_Transcript_for_Testing.txt"
+        raw_text = load_transcript(file_path)
+
+        # Chunk transcript
+        with span("chunk_transcript"):
+            docs = chunk_transcript_into_docs(raw_text, chunk_size=1500, chunk_overlap=120)
+        text_chunks = [doc.page_content for doc in docs]
+
+        speaker_pairs_list = []
+        chunk_summaries = []
+        for i, text_chunk in enumerate(text_chunks):
+            with span("attribute_and_summarize", chunk=i):
+                speaker_pairs, summary = attribute_and_summarize(text_chunk, deadline)
+            speaker_pairs_list.append(speaker_pairs)
+            chunk_summaries.append(summary)
+
+        # Evaluation and fixes are optional: they must leave the aggregation the time it needs
+        aggregation_reserve = deadline.stage_estimates["aggregate"]
+
+        # Evaluate all chunk summaries together, in as few evaluator calls as possible
+        try:
+            with deadline.reserving(aggregation_reserve), span("evaluate"):
+                evaluations = llm_evaluate_summaries_batch(
+                    [evaluation_input(text_chunk, summary) for text_chunk, summary in zip(text_chunks, chunk_summaries)]
+                )
+        except DeadlineExceeded:
+            deadline.record("skip_evaluation")
+            evaluations = []
+        scores_list = [score for score, _ in evaluations]
+        print (scores_list)
+
+        below_threshold = [i for i, score in enumerate(scores_list) if score < 85]
+        skip_fixes = bool(below_threshold) and deadline.should_degrade("skip_fix_loop")
+        if below_threshold and not skip_fixes and not deadline.can_afford("fix_loop", "aggregate"):
+            deadline.record("skip_fix_loop")
+            skip_fixes = True
+        if below_threshold and not skip_fixes:
+            try:
+                with deadline.reserving(aggregation_reserve):
+                    # Attempt re-fix for every low-scoring chunk, then re-evaluate all fixes in one batch
+                    if fix_candidates > 1:
+                        # Speculative: several candidates per chunk, generated and re-scored in parallel
+                        jobs = [(i, chunk_summaries[i], evaluations[i][1], speaker_pairs_list[i]) for i in below_threshold]
+                        fixes, new_evaluations = asyncio.run(speculative_fixes(jobs, fix_candidates, text_chunks))
+                    else:
+                        fixes = []
+                        for i in below_threshold:
+                            with span("fix", chunk=i):
+                                fixes.append((i, generate_fix(chunk_summaries[i], evaluations[i][1], speaker_pairs_list[i])))
+
+                        with span("re_evaluate"):
+                            new_evaluations = llm_evaluate_summaries_batch(
+                                [evaluation_input(text_chunks[i], fixed) for i, fixed in fixes]
+                            )
+                    # Keep the best-scoring fix per chunk, if it beats the original
+                    improved = set()
+                    for (i, fixed), (new_score, new_crit) in zip(fixes, new_evaluations):
+                        if new_score > scores_list[i]:
+                            chunk_summaries[i] = fixed
+                            scores_list[i] = new_score
+                            improved.add(i)
+                    for i in sorted(improved):
+                        print(f"SUCCESS IMPROVEMENT {scores_list[i]}")
+            except DeadlineExceeded:
+                # Out of time mid-loop: keep the original summaries
+                deadline.record("skip_fix_loop")
+        total_score = sum(scores_list)
+
+        # Now we do the multi aggregator approach:
+        # 1) aggregator pass on the first half
+        # 2) aggregator pass on the second half
+        # 3) final aggregator merges them
+
+        n = len(chunk_summaries)
+        mid = n // 2
+        first_half = chunk_summaries[:mid]
+        second_half = chunk_summaries[mid:]
+        average_score=total_score/len(scores_list) if scores_list else None
+        # Decide up front, from the stage estimates, how much aggregation still fits
+        collapse, merge_model = deadline.plan_aggregation()
+        if collapse:
+            # Out of time for the hierarchy: one aggregator pass over all chunks
+            final_text_note = aggregate_chunk_summaries_custom_structure(chunk_summaries)
+        else:
+            # aggregator #1
+            partial_note_1 = aggregate_chunk_summaries_custom_structure(first_half)
+
+            # aggregator #2
+            partial_note_2 = aggregate_chunk_summaries_custom_structure(second_half)
+
+            # final aggregator merges partial notes
+            final_text_note = final_aggregator_merge_two(partial_note_1, partial_note_2, model=merge_model)
+
+        # Instead of local convert, we call the "API"
+        final_html = call_html_converter(final_text_note)
+
+        # Save result
+        with open("final_therapy_note.html", "w", encoding="utf-8") as f:
+            f.write(final_html)
+
+        # Run metadata: scores and which deadline degradations were applied
+        metadata = {"scores": scores_list, "average_score": average_score}
+        metadata.update(deadline.metadata())
+        metadata["hedging"] = get_hedging_metrics()
+        metadata["fix_candidates"] = fix_candidates
+        with open("final_therapy_note.meta.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
 
     print("[INFO] Done! Final therapy note saved to final_therapy_note.html")
 
 
 if __name__ == "__main__":
-    main()
+    # Optional per-note time budget in seconds
+    deadline_seconds = os.environ.get("NOTE_DEADLINE_SECONDS")
+    # Optional hedged requests for slow LLM calls
+    if os.environ.get("LLM_HEDGING"):
+        enable_hedging()
+    # Optional speculative fixes: number of fix candidates per low-scoring chunk
+    fix_candidates = int(os.environ.get("SPECULATIVE_FIXES", "1"))
+    # Optional timeline trace of the run (Chrome trace format)
+    trace_path = os.environ.get("PIPELINE_TRACE")
+    if trace_path:
+        enable_tracing()
+    try:
+        main(float(deadline_seconds) if deadline_seconds else None, fix_candidates)
+    finally:
+        if trace_path:
+            save_trace(trace_path)
@@ -0,0 +1,49 @@
+# note_renderers.py
+
+import json
+import re
+from dataclasses import asdict
+from typing import Iterator
+
+from note_structure import Note
+
+
+def render_json(note: Note) -> Iterator[str]:
+    """
+    Renders a parsed note as JSON, one section at a time.
+    Quotes carry their transcript offsets (null when unknown).
+    """
+    yield '{"title": ' + json.dumps(note.title) + ', "sections": ['
+    for i, section in enumerate(note.sections):
+        yield ("," if i else "") + "\n  " + json.dumps(asdict(section), ensure_ascii=False)
+    yield "\n]}\n"
+
+
+def _bold_quotes_md(text: str) -> str:
+    return re.sub(r'"([^"]+)"', r'**"\1"**', text)
+
+
+def render_markdown(note: Note) -> Iterator[str]:
+    """
+    Renders a parsed note as Markdown: one heading per section, one line per
+    sentence, quotes in bold and the Plan as a numbered list (with any lines
+    before or after the list kept around it).
+    """
+    yield f"# {note.title}\n"
+    for section in note.sections:
+        yield f"\n## {section.name}\n\n"
+        if section.plan_items:
+            for sentence in section.plan_intro:
+                yield f"{_bold_quotes_md(sentence.text)}  \n"
+            if section.plan_intro:
+                yield "\n"
+            for item in section.plan_items:
+                yield f"{item.number}. {_bold_quotes_md(item.text)}\n"
+            if section.plan_outro:
+                yield "\n"
+            for sentence in section.plan_outro:
+                yield f"{_bold_quotes_md(sentence.text)}  \n"
+        else:
+            for sentence in section.sentences:
+                # Two trailing spaces: a Markdown line break inside the paragraph
+                yield f"{_bold_quotes_md(sentence.text)}  \n"
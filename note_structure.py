@@ -0,0 +1,183 @@
+# note_structure.py
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+NOTE_TITLE = "Speech Therapy Note"
+SECTION_ORDER = ["Subjective", "Objective", "Assessment", "Plan"]
+HEADINGS = [NOTE_TITLE] + SECTION_ORDER
+
+QUOTE_RE = re.compile(r'"([^"]+)"')
+PLAN_ITEM_RE = re.compile(r'^\s*(\d+)[.)]\s+(.*)$')
+SENTENCE_END_RE = re.compile(r'[.!?]["”]?$')
+
+
+@dataclass
+class Quote:
+    text: str
+    # Character offsets into the session transcript, or None if it wasn't found there
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+
+@dataclass
+class Sentence:
+    text: str
+    quotes: List[Quote] = field(default_factory=list)
+
+
+@dataclass
+class PlanItem:
+    number: int
+    text: str
+    quotes: List[Quote] = field(default_factory=list)
+
+
+@dataclass
+class Section:
+    name: str
+    sentences: List[Sentence] = field(default_factory=list)
+    plan_items: List[PlanItem] = field(default_factory=list)
+    # Plan only: lines before the first and after the last numbered item
+    plan_intro: List[Sentence] = field(default_factory=list)
+    plan_outro: List[Sentence] = field(default_factory=list)
+
+
+@dataclass
+class Note:
+    title: str
+    sections: List[Section] = field(default_factory=list)
+
+    def section(self, name: str) -> Optional[Section]:
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Splits text at sentence endings (., ! or ? followed by whitespace and a
+    capital letter or a quote), but never inside a quoted passage.
+    """
+    sentences = []
+    start = 0
+    in_quote = False
+    for i, char in enumerate(text):
+        if char == '"':
+            in_quote = not in_quote
+            # A closing quote right after sentence punctuation ends the sentence: ...: "I'm done." Next
+            if in_quote or i == 0 or text[i - 1] not in ".!?":
+                continue
+        elif in_quote or char not in ".!?":
+            continue
+
+        rest = text[i + 1:]
+        match = re.match(r'\s+(?=[A-Z"])', rest)
+        if match:
+            sentences.append(text[start:i + 1].strip())
+            start = i + 1 + match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return [s for s in sentences if s]
+
+
+def locate_quote(quote_text: str, transcript: Optional[str]) -> Quote:
+    """
+    Finds a quote in the transcript (case-insensitive) and records its offsets.
+    """
+    quote = Quote(quote_text)
+    if transcript:
+        needle = quote_text.strip().rstrip(".!?,").lower()
+        position = transcript.lower().find(needle) if needle else -1
+        if position >= 0:
+            quote.start = position
+            quote.end = position + len(needle)
+    return quote
+
+
+def _quotes_in(text: str, transcript: Optional[str]) -> List[Quote]:
+    return [locate_quote(q, transcript) for q in QUOTE_RE.findall(text)]
+
+
+def _sentences(text: str, transcript: Optional[str]) -> List[Sentence]:
+    return [
+        Sentence(sentence_text, _quotes_in(sentence_text, transcript))
+        for sentence_text in split_sentences(" ".join(text.split()))
+    ]
+
+
+def _continues_item(line: str, item_text: str) -> bool:
+    """
+    True if a non-numbered Plan line wraps the item before it: it is indented,
+    or the item stops mid-sentence.
+    """
+    return line[:1].isspace() or not SENTENCE_END_RE.search(item_text)
+
+
+def parse_note(final_text: str, transcript: Optional[str] = None) -> Note:
+    """
+    Parses a plain-text note into a Note: sections, their sentences and
+    quotes, and the numbered Plan items. If the session transcript is given,
+    each quote gets its character offsets in it.
+    """
+    # Same section rules as the original HTML converter: a heading line starts
+    # a section, text before the first heading is ignored, and a repeated
+    # heading replaces the earlier section.
+    bodies = {}
+    current_section = None
+    section_content = []
+
+    for line in final_text.splitlines():
+        line_stripped = line.strip()
+
+        if line_stripped in HEADINGS:
+            if current_section:
+                bodies[current_section] = "\n".join(section_content)
+                section_content = []
+            current_section = line_stripped
+        elif current_section:
+            section_content.append(line)
+
+    if current_section and section_content:
+        bodies[current_section] = "\n".join(section_content)
+
+    note = Note(title=NOTE_TITLE)
+    for name in SECTION_ORDER:
+        if name not in bodies:
+            continue
+        section = Section(name=name)
+        content = bodies[name].strip()
+
+        if name == "Plan":
+            intro, trailing = [], []
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                match = PLAN_ITEM_RE.match(line)
+                if match:
+                    if trailing:
+                        # Text between two items belongs to the earlier one
+                        section.plan_items[-1].text += " " + " ".join(trailing)
+                        trailing = []
+                    section.plan_items.append(PlanItem(int(match.group(1)), match.group(2).strip()))
+                elif not section.plan_items:
+                    intro.append(line.strip())
+                elif trailing or not _continues_item(line, section.plan_items[-1].text):
+                    # A line of its own; it closes the Plan unless another item follows
+                    trailing.append(line.strip())
+                else:
+                    section.plan_items[-1].text += " " + line.strip()
+            for item in section.plan_items:
+                item.quotes = _quotes_in(item.text, transcript)
+            if section.plan_items:
+                section.plan_intro = _sentences(" ".join(intro), transcript)
+                section.plan_outro = _sentences(" ".join(trailing), transcript)
+
+        if name != "Plan" or not section.plan_items:
+            section.sentences = _sentences(content, transcript)
+
+        note.sections.append(section)
+    return note
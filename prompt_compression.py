@@ -0,0 +1,214 @@
+# prompt_compression.py
+
+import re
+from bisect import bisect_right
+from typing import List, Optional, Set, Tuple
+
+from speaker_attribution import split_into_sentences_or_turns
+
+# Filler that carries no clinical content
+FILLER_PATTERNS = [
+    r"\b(?:mhm+|mm+-?hmm+|uh-?huh|um+|uh+|hmm+|erm)\b[,.]?",
+    r"\byou know\b,?",
+    r"\bI mean\b,",
+]
+# Whole turns that are only a backchannel. Answers ("yes", "right", "sure")
+# don't belong here: "Yes." can be the reply to a risk question. Even these
+# are only dropped from Therapist turns: a client's "Okay." or "Mhm." is often
+# their agreement to a homework or Plan item.
+ACKNOWLEDGEMENTS = {"okay", "ok", "mhm", "mmhmm", "uhhuh"}
+
+# Therapist housekeeping that never matters for the summary
+BOILERPLATE_PATTERNS = [
+    r"\bconfidential",
+    r"\brecord(?:ed|ing)\b",
+    r"\bconsent\b",
+    r"\bbefore we (?:begin|start|get started)\b",
+    r"\b(?:any|do you have) questions (?:before|about)\b",
+    r"\bour time (?:is|for today)\b",
+    r"\bsee you next (?:week|time|session)\b",
+]
+
+STOPWORDS = {
+    "about", "above", "after", "again", "against", "because", "before", "being", "below", "between",
+    "client", "could", "should", "would", "summary", "their", "there", "these", "those", "therapist",
+    "through", "under", "until", "which", "while", "where", "quote", "quotes", "include", "including",
+    "missing", "mention", "mentions", "however", "important", "specific", "details", "clinical",
+}
+
+GAP_MARKER = "[...]"
+
+
+def extract_quotes(summary_text: str) -> List[str]:
+    """
+    Returns the direct quotes (text inside double quotes) used in a summary.
+    """
+    quotes = re.findall(r'["“]([^"“”]+)["”]', summary_text)
+    return [q.strip() for q in quotes if len(q.strip()) > 3]
+
+
+def trim_filler(sentence: str, drop_acknowledgements: bool = False) -> str:
+    """
+    Removes filler words from a sentence. If nothing but filler or an
+    acknowledgement is left, returns "" when 'drop_acknowledgements' is set
+    and the sentence unchanged otherwise.
+    """
+    trimmed = sentence
+    for pattern in FILLER_PATTERNS:
+        trimmed = re.sub(pattern, "", trimmed, flags=re.IGNORECASE)
+    trimmed = re.sub(r"\s+([,.!?])", r"\1", trimmed)
+    trimmed = re.sub(r"^[\s,.]+", "", trimmed)
+    trimmed = " ".join(trimmed.split())
+
+    core = re.sub(r"[^\w\s]", "", trimmed).strip().lower()
+    if not core or core in ACKNOWLEDGEMENTS:
+        return "" if drop_acknowledgements else sentence
+    return trimmed
+
+
+def is_boilerplate(sentence: str) -> bool:
+    return any(re.search(pattern, sentence, flags=re.IGNORECASE) for pattern in BOILERPLATE_PATTERNS)
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s']", " ", text)
+    return " ".join(text.split())
+
+
+def locate_quotes(units: List[str], quotes: List[str]) -> Set[int]:
+    """
+    Finds the index of the sentence/turn each quote comes from, using character
+    offsets into the joined (normalized) conversation so quotes spanning two
+    sentences are located as well.
+    """
+    starts = []
+    offset = 0
+    normalized_units = []
+    for unit in units:
+        normalized = _normalize(unit)
+        starts.append(offset)
+        normalized_units.append(normalized)
+        offset += len(normalized) + 1
+    joined = " ".join(normalized_units)
+
+    found = set()
+    for quote in quotes:
+        needle = _normalize(quote)
+        if not needle:
+            continue
+        position = joined.find(needle)
+        if position < 0:
+            continue
+        first = bisect_right(starts, position) - 1
+        last = bisect_right(starts, position + len(needle) - 1) - 1
+        found.update(range(first, last + 1))
+    return found
+
+
+def _keywords(text: str) -> Set[str]:
+    words = re.findall(r"[a-z']{5,}", text.lower())
+    return {w for w in words if w not in STOPWORDS}
+
+
+def _critique_matches(units: List[str], critique: str, min_overlap: int = 2) -> Set[int]:
+    critique_words = _keywords(critique)
+    if not critique_words:
+        return set()
+    return {
+        i for i, unit in enumerate(units)
+        if len(critique_words & _keywords(unit)) >= min_overlap
+    }
+
+
+def compress_units(
+    units: List[str],
+    speakers: Optional[List[str]] = None,
+    quotes: Optional[List[str]] = None,
+    critique: str = "",
+    window: Optional[int] = None
+) -> List[str]:
+    """
+    Core compression over a list of sentences/turns:
+    - keeps sentences containing a summary quote untouched (so quotes stay verbatim)
+    - drops boilerplate from labeled Therapist turns only (never from client
+      or unlabeled text, where the same words can be clinically meaningful)
+    - trims filler from everything else; whole acknowledgement turns
+      ("Okay.", "Mhm.") are dropped from Therapist turns only
+    - if 'window' is set, keeps only sentences within 'window' of a quote or a
+      critique-relevant sentence and marks the dropped stretches with [...]
+    """
+    quote_units = locate_quotes(units, quotes or [])
+
+    keep = set(range(len(units)))
+    if window is not None:
+        anchors = quote_units | _critique_matches(units, critique)
+        # Without anchors we can't tell what's relevant, so keep everything
+        if anchors:
+            keep = {
+                j for i in anchors
+                for j in range(max(0, i - window), min(len(units), i + window + 1))
+            }
+
+    compressed = []
+    skipped = False
+    for i, unit in enumerate(units):
+        speaker = speakers[i] if speakers else None
+        text = unit
+        if i not in quote_units:
+            if i not in keep or (speaker == "Therapist" and is_boilerplate(unit)):
+                text = ""
+            else:
+                text = trim_filler(unit, drop_acknowledgements=speaker == "Therapist")
+
+        if not text:
+            skipped = skipped or i not in keep
+            continue
+        if skipped and compressed:
+            compressed.append(GAP_MARKER)
+        skipped = False
+        compressed.append(f"{speaker}: {text}" if speaker else text)
+    return compressed
+
+
+def _report(label: str, original: str, compressed: str) -> float:
+    ratio = len(compressed) / len(original) if original else 1.0
+    print(f"[INFO] Compressed {label}: {len(original)} -> {len(compressed)} chars (ratio {ratio:.2f})")
+    return ratio
+
+
+def compress_conversation_for_fix(
+    conversation_text: str,
+    summary_text: str,
+    critique: str,
+    window: int = 2
+) -> Tuple[str, float]:
+    """
+    Compresses the labeled conversation sent to fix_summary_with_critique:
+    only the turns around the summary's quotes and the critique's points are kept.
+    Returns (compressed_text, compression_ratio).
+    """
+    speakers, units = [], []
+    for line in conversation_text.splitlines():
+        speaker, sep, text = line.partition(": ")
+        if not sep:
+            speaker, text = None, line
+        speakers.append(speaker)
+        units.append(text)
+
+    compressed = "\n".join(
+        compress_units(units, speakers, extract_quotes(summary_text), critique, window)
+    )
+    return compressed, _report("fix conversation", conversation_text, compressed)
+
+
+def compress_chunk_for_evaluation(chunk_text: str, summary_text: str) -> Tuple[str, float]:
+    """
+    Compresses the raw chunk sent to llm_evaluate_summary by trimming filler only.
+    The chunk is unlabeled, so no boilerplate is dropped, and there is no
+    windowing: the evaluator scores completeness, so it needs every substantive
+    sentence. Returns (compressed_text, compression_ratio).
+    """
+    units = split_into_sentences_or_turns(chunk_text)
+    compressed = " ".join(compress_units(units, quotes=extract_quotes(summary_text)))
+    return compressed, _report("evaluation chunk", chunk_text, compressed)
@@ -1,9 +1,30 @@
 # quality_assessment.py
 
-import openai
-from typing import Tuple
+import asyncio
+import re
+from llm import acreate_chat_completion, create_chat_completion
+from tracing import traced
+from typing import List, Optional, Tuple
 
 
+EVALUATOR_SYSTEM_PROMPT = (
+    "You are an evaluator that compares a raw therapy conversation snippet to its summary. "
+    "Your evaluation focuses on these key criteria:\n"
+    "1. Completeness: Does the summary include all key clinical information?\n"
+    "2. Quote Integration: Are client quotes included immediately after the relevant feelings/thoughts they illustrate?\n"
+    "3. Clinical Relevance: Does the summary highlight therapeutically significant content?\n"
+    "4. Structure & Clarity: Is the summary well-organized and clear?\n\n"
+    "Provide a 0-100 numeric score and detailed critique focusing on these areas."
+)
+
+EVALUATION_CRITERIA = """Evaluate the summary on these specific criteria:
+1. COMPLETENESS: Does it capture all key information from the original text?
+2. QUOTE INTEGRATION: Are quotes positioned immediately after the feelings/thoughts they illustrate?
+3. CLINICAL RELEVANCE: Does it highlight clinically significant information?
+4. STRUCTURE & CLARITY: Is it well-organized and easy to understand?"""
+
+
+@traced()
 def llm_evaluate_summary(chunk_text: str, summary_text: str) -> Tuple[int, str]:
     """
     Uses an LLM to evaluate how well 'summary_text' captures the main ideas
@@ -16,15 +37,7 @@ def llm_evaluate_summary(chunk_text: str, summary_text: str) -> Tuple[int, str]:
     Critique: short text describing what's missing / inaccurate.
     """
 
-    system_prompt = (
-        "You are an evaluator that compares a raw therapy conversation snippet to its summary. "
-        "Your evaluation focuses on these key criteria:\n"
-        "1. Completeness: Does the summary include all key clinical information?\n"
-        "2. Quote Integration: Are client quotes included immediately after the relevant feelings/thoughts they illustrate?\n"
-        "3. Clinical Relevance: Does the summary highlight therapeutically significant content?\n"
-        "4. Structure & Clarity: Is the summary well-organized and clear?\n\n"
-        "Provide a 0-100 numeric score and detailed critique focusing on these areas."
-    )
+    system_prompt = EVALUATOR_SYSTEM_PROMPT
 
     user_prompt = f"""
 Below is the raw chunk of conversation (unlabeled or partially labeled). Then follows the summary.
@@ -35,11 +48,7 @@ Raw chunk text:
 Summary produced:
 \"\"\"{summary_text}\"\"\"
 
-Evaluate the summary on these specific criteria:
-1. COMPLETENESS: Does it capture all key information from the original text?
-2. QUOTE INTEGRATION: Are quotes positioned immediately after the feelings/thoughts they illustrate?
-3. CLINICAL RELEVANCE: Does it highlight clinically significant information?
-4. STRUCTURE & CLARITY: Is it well-organized and easy to understand?
+{EVALUATION_CRITERIA}
 
 Provide:
 1) An overall SCORE: <integer> from 0-100
@@ -56,7 +65,7 @@ SCORE: [number]
 CRITIQUE: [detailed feedback]
 """
 
-    response = openai.ChatCompletion.create(
+    response = create_chat_completion(
         model="gpt-4",  # Using GPT-4 for better evaluation quality
         messages=[
             {"role": "system", "content": system_prompt},
@@ -67,7 +76,15 @@ CRITIQUE: [detailed feedback]
     )
 
     eval_output = response["choices"][0]["message"]["content"].strip()
+    return parse_evaluation_output(eval_output)
+
 
+def parse_evaluation_output(eval_output: str) -> Tuple[int, str]:
+    """
+    Parses an evaluator response of the form "SCORE: <n>" / "CRITIQUE: <text>".
+    Returns (score, critique); score defaults to 50 if it can't be parsed or
+    is outside 0-100.
+    """
     # Parse the output lines using simple text parsing
     score = 50  # Default score if parsing fails
     critique = ""
@@ -78,10 +95,10 @@ CRITIQUE: [detailed feedback]
         if line.upper().startswith("SCORE:"):
             try:
                 score_text = line.split(":", 1)[1].strip()
-                # Handle cases where score might have extra text
-                score_text = ''.join(c for c in score_text if c.isdigit())
-                if score_text:
-                    score = int(score_text)
+                # Handle cases where score might have extra text ("80/100", "[85]")
+                match = re.search(r"\d+", score_text)
+                if match and 0 <= int(match.group()) <= 100:
+                    score = int(match.group())
             except:
                 score = 50
         elif line.upper().startswith("CRITIQUE:"):
@@ -109,4 +126,185 @@ CRITIQUE: [detailed feedback]
         except:
             critique = "Error extracting critique from response."
 
-    return (score, critique)
\ No newline at end of file
+    return (score, critique)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (~4 characters per token), good enough for packing prompts.
+    """
+    return len(text) // 4 + 1
+
+
+def pack_evaluation_batches(
+    items: List[Tuple[str, str]],
+    max_input_tokens: int = 5000,
+    max_items: int = 6
+) -> List[List[int]]:
+    """
+    Groups item indices into batches whose chunk + summary text stays under
+    'max_input_tokens' (and at most 'max_items' per batch, so the answers fit
+    in the response). An item that is too large on its own gets its own batch.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i, (chunk_text, summary_text) in enumerate(items):
+        tokens = estimate_tokens(chunk_text) + estimate_tokens(summary_text)
+        if current and (current_tokens + tokens > max_input_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_evaluation_output(eval_output: str, n_items: int) -> List[Optional[Tuple[int, str]]]:
+    """
+    Splits a batched evaluator response on its "ITEM <i>" headers and parses each part.
+    Returns a list aligned with the items; entries that are missing, duplicated,
+    have no SCORE line or a score outside 0-100 are None.
+    """
+    results: List[Optional[Tuple[int, str]]] = [None] * n_items
+    seen = set()
+    parts = re.split(r'^\s*ITEM\s+(\d+)\s*:?\s*$', eval_output, flags=re.IGNORECASE | re.MULTILINE)
+    # parts = [preamble, index, body, index, body, ...]
+    for index_text, body in zip(parts[1::2], parts[2::2]):
+        index = int(index_text) - 1
+        if not 0 <= index < n_items:
+            continue
+        if index in seen:
+            # Answered twice: don't guess which answer is right
+            results[index] = None
+            continue
+        seen.add(index)
+        match = re.search(r'SCORE:\s*\D{0,3}(\d+)', body, flags=re.IGNORECASE)
+        if not match or not 0 <= int(match.group(1)) <= 100:
+            continue
+        results[index] = parse_evaluation_output(body.strip())
+    return results
+
+
+def batch_evaluation_request(batch_items: List[Tuple[str, str]]) -> dict:
+    """
+    Arguments for the chat completion call that scores 'batch_items' in one request.
+    Used for every batch, including single items, so all scores that get
+    compared come from the same prompt.
+    """
+    items_block = "\n\n".join(
+        f"ITEM {n + 1}\nRaw chunk text:\n\"\"\"{chunk_text}\"\"\"\n\nSummary produced:\n\"\"\"{summary_text}\"\"\""
+        for n, (chunk_text, summary_text) in enumerate(batch_items)
+    )
+
+    user_prompt = f"""
+Below are {len(batch_items)} items. Each item has a raw chunk of conversation (unlabeled or partially labeled) followed by its summary.
+Evaluate every item independently.
+
+{items_block}
+
+{EVALUATION_CRITERIA}
+
+For EACH item provide:
+1) An overall SCORE: <integer> from 0-100
+2) A concise CRITIQUE identifying specific issues that need improvement
+
+Focus especially on:
+- Whether quotes follow immediately after the client feelings/thoughts they illustrate
+- Missing important clinical details
+- The quality and relevance of selected quotes
+
+Return exactly {len(batch_items)} answers, in item order, formatted exactly as:
+ITEM 1
+SCORE: [number]
+CRITIQUE: [feedback]
+ITEM 2
+SCORE: [number]
+CRITIQUE: [feedback]
+"""
+
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": EVALUATOR_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0,
+        max_tokens=min(350 * len(batch_items), 2400)
+    )
+
+
+def parse_batch_response(response, n_items: int) -> List[Optional[Tuple[int, str]]]:
+    """
+    Parses the response to batch_evaluation_request. A single item is also
+    accepted without its "ITEM 1" header (scored 50 if no valid score).
+    """
+    eval_output = response["choices"][0]["message"]["content"].strip()
+    parsed = parse_batch_evaluation_output(eval_output, n_items)
+    if n_items == 1 and parsed[0] is None:
+        parsed[0] = parse_evaluation_output(eval_output)
+    if sum(p is not None for p in parsed) != n_items:
+        print(f"[WARN] Batch evaluation returned {sum(p is not None for p in parsed)}/{n_items} valid items, "
+              f"evaluating the rest individually")
+    return parsed
+
+
+@traced()
+def llm_evaluate_summaries_batch(
+    items: List[Tuple[str, str]],
+    max_input_tokens: int = 5000,
+    max_items: int = 6
+) -> List[Tuple[int, str]]:
+    """
+    Evaluates several (chunk_text, summary_text) pairs with as few evaluator
+    calls as possible. Items are packed into batches up to 'max_input_tokens';
+    each batch is scored in one request that returns a SCORE/CRITIQUE per item.
+
+    Returns a list of (score, critique) aligned with 'items'. If the response
+    doesn't contain a valid answer for an item, that item is re-evaluated on
+    its own with the same batch prompt.
+    """
+    results: List[Optional[Tuple[int, str]]] = [None] * len(items)
+
+    for batch in pack_evaluation_batches(items, max_input_tokens, max_items):
+        response = create_chat_completion(**batch_evaluation_request([items[i] for i in batch]))
+        parsed = parse_batch_response(response, len(batch))
+
+        for i, result in zip(batch, parsed):
+            # Fall back to evaluating the item alone for anything we couldn't parse
+            if result is None:
+                result = parse_batch_response(create_chat_completion(**batch_evaluation_request([items[i]])), 1)[0]
+            results[i] = result
+
+    return results
+
+
+async def allm_evaluate_summaries_batch(
+    items: List[Tuple[str, str]],
+    max_input_tokens: int = 5000,
+    max_items: int = 6
+) -> List[Tuple[int, str]]:
+    """
+    Async version of llm_evaluate_summaries_batch: same batches and prompt, but
+    all batches (and any single-item fallbacks) are sent concurrently, so
+    scoring many items costs about one evaluator round trip.
+    """
+    async def evaluate(batch_items):
+        response = await acreate_chat_completion(**batch_evaluation_request(batch_items))
+        return parse_batch_response(response, len(batch_items))
+
+    async def evaluate_batch(batch):
+        parsed = await evaluate([items[i] for i in batch])
+        # Fall back to evaluating the item alone for anything we couldn't parse
+        retries = [i for i, result in zip(batch, parsed) if result is None]
+        fallbacks = await asyncio.gather(*(evaluate([items[i]]) for i in retries))
+        retried = {i: result[0] for i, result in zip(retries, fallbacks)}
+        return [retried.get(i, result) for i, result in zip(batch, parsed)]
+
+    batches = pack_evaluation_batches(items, max_input_tokens, max_items)
+    batch_results = await asyncio.gather(*(evaluate_batch(batch) for batch in batches))
+
+    results: List[Optional[Tuple[int, str]]] = [None] * len(items)
+    for batch, parsed in zip(batches, batch_results):
+        for i, result in zip(batch, parsed):
+            results[i] = result
+    return results
@@ -1,7 +1,8 @@
 # app/speaker_attribution.py
 
 
-import openai
+from llm import create_chat_completion
+from tracing import traced
 from typing import List, Tuple
 import nltk
 nltk.download('punkt_tab', quiet=True)
@@ -14,6 +15,7 @@ def split_into_sentences_or_turns(text_chunk: str) -> List[str]:
     return lines
 
 
+@traced()
 def initial_llm_labeling(text_lines: List[str]) -> List[Tuple[str, str]]:
     """
     FIRST PASS:
@@ -54,7 +56,7 @@ Focus on sentence structure and content, not just keywords. Maintain conversatio
     4. Make your best determination even if uncertain
     """
 
-    response = openai.ChatCompletion.create(
+    response = create_chat_completion(
         model="gpt-3.5-turbo",
         messages=[
             {"role": "system", "content": system_prompt},
@@ -87,6 +89,7 @@ Focus on sentence structure and content, not just keywords. Maintain conversatio
     return labeled_pairs
 
 
+@traced()
 def refine_llm_labels(
         labeled_pairs: List[Tuple[str, str]]
 ) -> List[Tuple[str, str]]:
@@ -150,7 +153,7 @@ Maintain logical conversation flow where speakers typically alternate.
     Client: [original text]
     """
 
-    response = openai.ChatCompletion.create(
+    response = create_chat_completion(
         model="gpt-3.5-turbo",
         messages=[
             {"role": "system", "content": system_prompt},
@@ -180,15 +183,17 @@ Maintain logical conversation flow where speakers typically alternate.
     return final_pairs
 
 
-def multi_step_speaker_attribution(text_chunk: str) -> List[Tuple[str, str]]:
+def multi_step_speaker_attribution(text_chunk: str, refine: bool = True) -> List[Tuple[str, str]]:
     """
     Overall function to:
     1) Split the text into lines
     2) First-pass labeling with LLM
-    3) Second-pass refinement with LLM
+    3) Second-pass refinement with LLM (skipped when 'refine' is False)
     Returns final list of (speaker, content).
     """
     lines = split_into_sentences_or_turns(text_chunk)
     first_pass = initial_llm_labeling(lines)
+    if not refine:
+        return first_pass
     refined = refine_llm_labels(first_pass)
     return refined
@@ -1,8 +1,10 @@
 # app/summarizer.py
 
-import openai
+from llm import create_chat_completion, acreate_chat_completion
+from tracing import traced
 from typing import List, Tuple
 
+@traced()
 def summarize_speaker_pairs(speaker_pairs: List[Tuple[str, str]]) -> str:
     """
     Takes a list of (speaker, text) from the final speaker attribution step,
@@ -63,7 +65,7 @@ Choose the 1 most meaningful and representative quotes that clearly illustrate t
 NEVER MORE THAN 480 tokens!! 
 """
 
-    response = openai.ChatCompletion.create(
+    response = create_chat_completion(
         model="gpt-3.5-turbo",  # Upgraded to GPT-4 for better quote selection and placement
         messages=[
             {"role": "system", "content": system_prompt},
@@ -76,10 +78,10 @@ NEVER MORE THAN 480 tokens!!
     summary_text = response["choices"][0]["message"]["content"].strip()
     return summary_text
 
-def fix_summary_with_critique(original_summary: str, critique: str, conversation_text: str) -> str:
+def _fix_messages(original_summary: str, critique: str, conversation_text: str, focus: str = "") -> List[dict]:
     """
-    Use the critique to fix or improve the summary.
-    We show the original chunk text again to ensure the LLM can incorporate missing details.
+    Builds the messages for the fix call. 'focus' optionally adds one extra
+    priority, used to vary speculative fix candidates.
     """
     system_prompt = (
         "You are a therapy note improvement specialist. Your task is to fix a summary that didn't meet quality standards."
@@ -118,16 +120,52 @@ Your task is to create an IMPROVED version that addresses ALL issues in the crit
 The improved summary should be clinically precise, include more meaningful quotes, and fix ALL issues mentioned in the critique.
 NEVER MORE THAN 480 tokens!! 
 """
-
-    response = openai.ChatCompletion.create(
+    if focus:
+        user_prompt += f"\nPriority for this revision: {focus}\n"
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+@traced()
+def fix_summary_with_critique(
+    original_summary: str,
+    critique: str,
+    conversation_text: str,
+    temperature: float = 0,
+    focus: str = ""
+) -> str:
+    """
+    Use the critique to fix or improve the summary.
+    We show the original chunk text again to ensure the LLM can incorporate missing details.
+    """
+    response = create_chat_completion(
         model="gpt-3.5-turbo",  # Using GPT-4 for more accurate improvement
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0,
+        messages=_fix_messages(original_summary, critique, conversation_text, focus),
+        temperature=temperature,
         max_tokens=700  # Increased for more comprehensive improvement
     )
 
+    revised_summary = response["choices"][0]["message"]["content"].strip()
+    return revised_summary
+
+async def afix_summary_with_critique(
+    original_summary: str,
+    critique: str,
+    conversation_text: str,
+    temperature: float = 0,
+    focus: str = ""
+) -> str:
+    """
+    Async version of fix_summary_with_critique, so several fix candidates can be generated at once.
+    """
+    response = await acreate_chat_completion(
+        model="gpt-3.5-turbo",
+        messages=_fix_messages(original_summary, critique, conversation_text, focus),
+        temperature=temperature,
+        max_tokens=700
+    )
+
     revised_summary = response["choices"][0]["message"]["content"].strip()
     return revised_summary
\ No newline at end of file
@@ -0,0 +1,134 @@
+# trace_analyzer.py
+
+import argparse
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+# Parent time between children shorter than this is not reported as its own entry
+MIN_SELF_MS = 1.0
+
+
+def load_spans(trace_path: str) -> List[dict]:
+    with open(trace_path, "r", encoding="utf-8") as f:
+        trace = json.load(f)
+    spans = []
+    for event in trace["traceEvents"]:
+        if event.get("ph") != "X":
+            continue
+        args = event.get("args", {})
+        spans.append({
+            "id": args.get("span_id"),
+            "parent": args.get("parent_id"),
+            "name": event["name"],
+            "cat": event.get("cat", ""),
+            "start": event["ts"] / 1e3,  # ms
+            "end": (event["ts"] + event["dur"]) / 1e3,
+            "tags": {k: v for k, v in args.items() if k not in ("span_id", "parent_id")},
+        })
+    return spans
+
+
+def critical_path(span: dict, children: Dict[int, List[dict]]) -> List[dict]:
+    """
+    Walks back from the end of 'span': take the child that finishes last, then
+    the child that finishes last before that one started, and so on. Each
+    chosen child is expanded the same way. Returns the leaf spans on the path
+    in time order; time the parent spends outside its children (local work)
+    shows up as "<name> (self)" entries.
+    """
+    kids = sorted(children.get(span["id"], []), key=lambda s: s["end"])
+    if not kids:
+        return [span]
+
+    chain = []
+    current = kids[-1]
+    while current is not None:
+        chain.append(current)
+        earlier = [k for k in kids if k["end"] <= current["start"]]
+        current = earlier[-1] if earlier else None
+
+    path = []
+    cursor = span["start"]
+    for child in reversed(chain):
+        if child["start"] - cursor >= MIN_SELF_MS:
+            path.append(_self_time(span, cursor, child["start"]))
+        path.extend(critical_path(child, children))
+        cursor = child["end"]
+    if span["end"] - cursor >= MIN_SELF_MS:
+        path.append(_self_time(span, cursor, span["end"]))
+    return path
+
+
+def _self_time(span: dict, start: float, end: float) -> dict:
+    return {**span, "name": f"{span['name']} (self)", "start": start, "end": end}
+
+
+def idle_gaps(spans: List[dict], root: dict, min_gap_ms: float) -> List[tuple]:
+    """
+    Intervals inside 'root' during which no LLM call was in flight on any thread.
+    """
+    busy = sorted((s["start"], s["end"]) for s in spans if s["cat"] == "llm")
+    gaps = []
+    cursor = root["start"]
+    for start, end in busy:
+        if start - cursor >= min_gap_ms:
+            gaps.append((cursor, start))
+        cursor = max(cursor, end)
+    if root["end"] - cursor >= min_gap_ms:
+        gaps.append((cursor, root["end"]))
+    return gaps
+
+
+def _label(span: dict) -> str:
+    tags = ", ".join(f"{k}={v}" for k, v in span["tags"].items())
+    return f"{span['name']} [{tags}]" if tags else span["name"]
+
+
+def analyze(trace_path: str, min_gap_ms: float = 100.0, top: int = 10):
+    """
+    Prints the critical path of the run and the largest gaps with no LLM call in flight.
+    """
+    spans = load_spans(trace_path)
+    if not spans:
+        print("No spans in trace.")
+        return
+
+    children = defaultdict(list)
+    for s in spans:
+        children[s["parent"]].append(s)
+    roots = children.get(None, [])
+    root = max(roots, key=lambda s: s["end"] - s["start"])
+    total = root["end"] - root["start"]
+
+    print(f"Run: {_label(root)} - {total / 1e3:.2f}s")
+    print("\nCritical path:")
+    path = critical_path(root, children)
+    for s in path:
+        duration = s["end"] - s["start"]
+        print(f"  {s['start'] - root['start']:10.0f}ms  {duration:9.0f}ms  {100 * duration / total:5.1f}%  {_label(s)}")
+    on_path = sum(s["end"] - s["start"] for s in path)
+    print(f"  Spans on the critical path cover {100 * on_path / total:.1f}% of the run")
+
+    by_name = defaultdict(float)
+    for s in path:
+        by_name[s["name"]] += s["end"] - s["start"]
+    print("\nCritical path time by span name:")
+    for name, duration in sorted(by_name.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {duration:9.0f}ms  {name}")
+
+    gaps = idle_gaps(spans, root, min_gap_ms)
+    print(f"\nIdle gaps (no LLM call in flight, >= {min_gap_ms:.0f}ms): {len(gaps)}, "
+          f"{sum(end - start for start, end in gaps):.0f}ms total")
+    for start, end in sorted(gaps, key=lambda g: g[0] - g[1])[:top]:
+        print(f"  {start - root['start']:10.0f}ms  {end - start:9.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the critical path and idle gaps of a pipeline trace.")
+    parser.add_argument("trace", help="trace file written with PIPELINE_TRACE")
+    parser.add_argument("--min-gap-ms", type=float, default=100.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    analyze(args.trace, args.min_gap_ms, args.top)
@@ -0,0 +1,112 @@
+# tracing.py
+
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Tags (chunk index, model, ...) and the parent span id are inherited by nested spans
+_context = contextvars.ContextVar("trace_context", default=({}, None))
+
+
+class Tracer:
+    """
+    Records start/end spans of pipeline stages and LLM calls and writes them
+    in Chrome trace format (open in chrome://tracing or ui.perfetto.dev).
+    Each span carries its own id and its parent's id, so the analyzer can
+    rebuild the call tree even when spans run concurrently.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._origin = time.perf_counter()
+        self._thread_names = {}
+
+    @contextmanager
+    def span(self, name: str, category: str = "stage", **tags):
+        parent_tags, parent_id = _context.get()
+        span_tags = {**parent_tags, **tags}
+        span_id = next(self._ids)
+        token = _context.set((span_tags, span_id))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _context.reset(token)
+            self._record(name, category, start, end, span_tags, span_id, parent_id)
+
+    def _record(self, name, category, start, end, tags, span_id, parent_id):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self._origin) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": {**tags, "span_id": span_id, "parent_id": parent_id},
+        }
+        with self._lock:
+            self.events.append(event)
+            self._thread_names[thread.ident] = thread.name
+
+    def save(self, path: str):
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._thread_names.items()
+            ]
+            trace = {"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms"}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def save_trace(path: str):
+    if _tracer is not None:
+        _tracer.save(path)
+        print(f"[INFO] Trace saved to {path}")
+
+
+@contextmanager
+def span(name: str, category: str = "stage", **tags):
+    """
+    Records a span if tracing is enabled, otherwise does nothing.
+    """
+    if _tracer is None:
+        yield
+        return
+    with _tracer.span(name, category, **tags):
+        yield
+
+
+def traced(category: str = "stage"):
+    """
+    Decorator that records a span named after the function on every call.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.span(fn.__name__, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -10,7 +10,12 @@ def load_transcript(file_path: str) -> str:
     """
     with open(file_path, 'r', encoding='utf-8') as f:
         text = f.read()
-    # Normalize whitespace
+    return normalize_whitespace(text)
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Collapses newlines and repeated whitespace into single spaces.
+    """
     text = text.replace('\r\n', ' ').replace('\n', ' ')
     text = ' '.join(text.split())
     return text